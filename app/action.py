@@ -19,6 +19,7 @@ class Action:
     def __call__(self, ids: list[str]):
         """
         Dunder method makes action object callable.
+        Returns the ids the action succeeded on, so callers can retry the rest.
         """
         creds = load_creds()
         url = f"https://gmail.googleapis.com/gmail/v1/users/me/messages/batchModify"
@@ -31,6 +32,7 @@ class Action:
         n = len(ids)
         iterations = (n//MAX_IDS_SUPPORTED) if n % MAX_IDS_SUPPORTED == 0 else ((n//MAX_IDS_SUPPORTED) + 1)
         print(f"Action {self.action} will be taken in {iterations} chunk.")
+        succeeded = []
         for i in range(iterations):
             start = i * MAX_IDS_SUPPORTED
             end = n if ((i+1) * MAX_IDS_SUPPORTED) > n else ((i+1) * MAX_IDS_SUPPORTED)
@@ -38,10 +40,11 @@ class Action:
             body = self.translate(id_chunk)
             res = requests.post(url, headers=headers, data=json.dumps(body))
             if res.status_code // 100 == 2:
-                print(f"Action {self.action} is done.")
-                return
+                print(f"Action {self.action} is done on chunk {i + 1}.")
+                succeeded.extend(id_chunk)
             else:
                 print(f"Failed to take action on {id_chunk}.")
+        return succeeded
 
 
     def translate(self, ids):
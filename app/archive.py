@@ -0,0 +1,125 @@
+import os
+import json
+import mmap
+import zlib
+import hashlib
+
+from pathlib import Path
+
+SEGMENT_SIZE = 256 * 1024 * 1024
+INDEX_FILE = "index.tsv"
+
+
+class MessageArchive:
+    """
+    Append-only archive of raw Gmail messages.
+
+    Messages are stored zlib compressed in segment files, a tab separated index maps
+    message id to (digest, segment, offset, length) and segments are read through mmap.
+    """
+    def __init__(self, path: str, segment_size: int = SEGMENT_SIZE) -> None:
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.segment_size = segment_size
+        self.index: dict[str, tuple[str, int, int, int]] = {}
+        self._maps: dict[int, tuple] = {}
+        self._load_index()
+        self.segment = max((segment for (_, segment, _, _) in self.index.values()), default=1)
+
+    def _segment_path(self, segment: int) -> Path:
+        return self.path / f"segment-{segment:05d}.bin"
+
+    def _load_index(self):
+        index_path = self.path / INDEX_FILE
+        if not index_path.exists():
+            return
+        with open(index_path, "rb") as fp:
+            content = fp.read()
+        if content and not content.endswith(b"\n"):
+            # A torn last line from an interrupted write is cut off, so the next entry starts on a line
+            # of its own. The message bytes it pointed at are just orphaned.
+            content = content[:content.rfind(b"\n") + 1]
+            with open(index_path, "r+b") as fp:
+                fp.truncate(len(content))
+        for line in content.decode().splitlines():
+            parts = line.split("\t")
+            if len(parts) != 5:
+                continue
+            id, digest, segment, offset, length = parts
+            self.index[id] = (digest, int(segment), int(offset), int(length))
+
+    def __contains__(self, id: str) -> bool:
+        return id in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def put(self, message: dict) -> bool:
+        """
+        Archives a raw message. Returns False if the same content is already stored for its id.
+        """
+        raw = json.dumps(message, separators=(",", ":"), sort_keys=True).encode()
+        digest = hashlib.sha256(raw).hexdigest()
+        id = message["id"]
+        if id in self.index and self.index[id][0] == digest:
+            return False
+
+        data = zlib.compress(raw)
+        segment_path = self._segment_path(self.segment)
+        if segment_path.exists() and segment_path.stat().st_size + len(data) > self.segment_size:
+            self.segment += 1
+            segment_path = self._segment_path(self.segment)
+
+        with open(segment_path, "ab") as fp:
+            offset = fp.tell()
+            fp.write(data)
+        # Data is written before the index entry so the index never points at missing bytes.
+        with open(self.path / INDEX_FILE, "a") as fp:
+            fp.write(f"{id}\t{digest}\t{self.segment}\t{offset}\t{len(data)}\n")
+        self.index[id] = (digest, self.segment, offset, len(data))
+        return True
+
+    def _map(self, segment: int, end: int):
+        if segment in self._maps:
+            fp, mm = self._maps[segment]
+            if end <= len(mm):
+                return mm
+            # Segment has grown since it was mapped.
+            mm.close()
+            fp.close()
+        fp = open(self._segment_path(segment), "rb")
+        mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps[segment] = (fp, mm)
+        return mm
+
+    def get(self, id: str) -> dict:
+        """
+        Returns the raw message stored for id.
+        """
+        _, segment, offset, length = self.index[id]
+        mm = self._map(segment, offset + length)
+        return json.loads(zlib.decompress(mm[offset:offset + length]))
+
+    def __iter__(self):
+        """
+        Yields raw messages in segment order so reads stay sequential.
+        """
+        entries = sorted(self.index.items(), key=lambda item: (item[1][1], item[1][2]))
+        for id, _ in entries:
+            yield self.get(id)
+
+    def close(self):
+        for fp, mm in self._maps.values():
+            mm.close()
+            fp.close()
+        self._maps = {}
+
+
+def get_archive():
+    """
+    Returns the archive pointed by DIR_ARCHIVE, None when archiving is not enabled.
+    """
+    dir_archive = os.environ.get("DIR_ARCHIVE")
+    if not dir_archive:
+        return None
+    return MessageArchive(dir_archive)
@@ -0,0 +1,101 @@
+import argparse
+import json
+import os
+
+from dotenv import load_dotenv
+from rule import create_composite_rule_from_schema
+from snapshot import Snapshot, overlap_matrix
+
+DEFAULT_SNAPSHOT = "emails.npz"
+
+
+def load_rules(file_path):
+    """
+    Loads composite rules from a file holding one rule or a list of rules.
+    """
+    if not os.path.exists(file_path):
+        raise ValueError(f"{file_path} does not exist")
+    with open(file_path, 'r') as fp:
+        schemas = json.load(fp)
+    if isinstance(schemas, dict):
+        schemas = [schemas]
+    return [(f"{os.path.basename(file_path)}[{i}]", create_composite_rule_from_schema(schema)) for i, schema in enumerate(schemas)]
+
+
+def backtest(snapshot: Snapshot, named_rules):
+    """
+    Evaluates every rule against the snapshot, returns match counts and the overlap matrix.
+    """
+    masks = [snapshot.evaluate(rule) for (_, rule) in named_rules]
+    overlaps = overlap_matrix(masks)
+    return overlaps.diagonal().copy(), overlaps
+
+
+def print_report(names, counts, overlaps, total):
+    print(f"Backtested {len(names)} rules against {total} emails.")
+    width = max([len(name) for name in names] + [4])
+    print(f"{'rule':<{width}}  {'matches':>8}")
+    for name, count in zip(names, counts):
+        print(f"{name:<{width}}  {count:>8}")
+
+    print("\nOverlap (emails matched by both rules):")
+    print(" " * width + "".join(f"{j:>8}" for j in range(len(names))))
+    for i, name in enumerate(names):
+        print(f"{name:<{width}}" + "".join(f"{overlaps[i][j]:>8}" for j in range(len(names))))
+
+
+def create_backtest_parser():
+    parser = argparse.ArgumentParser(description='Backtest rules against a columnar snapshot of the emails table.')
+    parser.add_argument(
+        '-s',
+        '--snapshot',
+        type=str,
+        default=DEFAULT_SNAPSHOT,
+        help='Path to snapshot file'
+    )
+    parser.add_argument(
+        '-e',
+        '--export',
+        action='store_true',
+        help='Export the emails table to the snapshot before backtesting'
+    )
+    parser.add_argument(
+        '-p',
+        '--path',
+        type=str,
+        nargs='*',
+        default=[],
+        help='Rule files to backtest, each holding a rule or a list of rules'
+    )
+    return parser
+
+
+def main():
+    parser = create_backtest_parser()
+    args = parser.parse_args()
+
+    load_dotenv()
+
+    if args.export:
+        from db import init_db, SessionLocal
+        init_db()
+        snapshot = Snapshot.export(SessionLocal())
+        snapshot.save(args.snapshot)
+        print(f"Exported {len(snapshot)} emails to {args.snapshot}.")
+    else:
+        snapshot = Snapshot.load(args.snapshot)
+
+    try:
+        named_rules = [named_rule for path in args.path for named_rule in load_rules(path)]
+    except Exception as e:
+        print(f"Following error occured {e}")
+        return
+    if len(named_rules) == 0:
+        return
+
+    counts, overlaps = backtest(snapshot, named_rules)
+    print_report([name for (name, _) in named_rules], counts, overlaps, len(snapshot))
+
+
+if __name__ == "__main__":
+    main()
@@ -8,13 +8,25 @@ load_dotenv()
 
 DATABASE_URL = f'postgresql://{os.environ.get("DB_USER")}:{os.environ.get("DB_PASSWORD")}@{os.environ.get("DB_HOST")}:{os.environ.get("DB_PORT")}/{os.environ.get("DB_DATABASE")}'
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Engine is created lazily so importing modules that only need models doesn't pay for the DB driver.
+_engine = None
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
 Base = declarative_base()
 
+def get_engine():
+    """
+    Creates the engine on first use and binds sessions to it.
+    """
+    global _engine
+    if _engine is None:
+        _engine = create_engine(DATABASE_URL)
+        SessionLocal.configure(bind=_engine)
+    return _engine
+
 def init_db():
     """
-    Initializes DB and creates the tables.
+    Initializes DB and brings the schema up to date.
+    Only the schema version is checked when there is nothing to migrate.
     """
-    import models
-    Base.metadata.create_all(engine)
\ No newline at end of file
+    from migrate import ensure_schema
+    ensure_schema(get_engine())
@@ -2,16 +2,25 @@ import os.path
 import json
 import base64
 import argparse
+import threading
+import time
 
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
+from sqlalchemy import select, insert, update, delete
+from archive import get_archive
 from db import init_db, SessionLocal
 from dotenv import load_dotenv
-from models import Email
-from util import load_creds
+from models import Email, Thread, RuleState
+from util import load_creds, parse_sender
 
 MAX_RESULTS = 500
+REPARSE_BATCH_SIZE = 1000
+# Partitioned listing splits date windows until each holds roughly this many messages.
+WINDOW_TARGET = 5000
+MIN_WINDOW_SECONDS = 60 * 60
+# Gmail launch date, windows are sized from here on. Older imported mail is listed by an open-ended window.
+GMAIL_EPOCH = 1080777600
 
 def get_db():
     db = SessionLocal()
@@ -25,12 +34,29 @@ def load_email(email, db):
 	res = db.query(Email).filter_by(email_id = email['id']).first()
 	if res:
 		return
-	db_email = Email(email_id=email['id'], message=email['message'], recv_from=email['recv_from'], date=email['date'], subject=email['subject'])
+	db_email = Email(**email_columns(email))
 	db.add(db_email)
 	db.commit()
 	db.refresh(db_email)
 	
 
+def email_columns(email):
+	"""
+	Maps parsed email to the columns of Email.
+	"""
+	from_address, from_domain = parse_sender(email['recv_from'])
+	return {
+		"email_id": email['id'],
+		"message": email['message'],
+		"recv_from": email['recv_from'],
+		"date": email['date'],
+		"subject": email['subject'],
+		"thread_id": email['thread_id'],
+		"from_address": from_address,
+		"from_domain": from_domain
+	}
+
+
 def parse_headers(headers, parsed_email):
 	"""
 	Parses email headers to fetch Date, From and Subject of the email.
@@ -62,11 +88,13 @@ def parse_email(email):
 		"id": "",
 		"message": "",
 		"date": 0,
-		"from": "",
-		"subject": ""
+		"recv_from": "",
+		"subject": "",
+		"thread_id": None
 	}
 
 	parsed_email["id"] = email["id"]
+	parsed_email["thread_id"] = email.get("threadId")
 	parsed_email['date'] = email['internalDate']
 
 	# Add data to parsed email.
@@ -91,6 +119,8 @@ def fetch_email(id: str):
 	"""
 	Fetch detailed email from gmail.
 	"""
+	from googleapiclient.discovery import build
+
 	# Gets credentials using Google OAuth Client
 	creds = load_creds()
 	# Gmail Service
@@ -99,6 +129,81 @@ def fetch_email(id: str):
 	return service.users().messages().get(userId="me", id=id).execute()
 
 
+def fetch_thread(service, id: str):
+	"""
+	Fetch all messages of a thread from gmail in a single call.
+	"""
+	return service.users().threads().get(userId="me", id=id).execute()
+
+
+def load_thread(thread, db, archive=None):
+	"""
+	Parses and loads every message of a thread, returns the number of emails loaded.
+	"""
+	i = 0
+	for message in thread.get("messages", []):
+		if archive is not None:
+			archive.put(message)
+		parsed_email = parse_email(message)
+		if parsed_email:
+			load_email(parsed_email, db)
+			i += 1
+		else:
+			print(f"Skipping email {message['id']} since no data is present.")
+	# Emails loaded before thread ids were stored are skipped by load_email, so set it on them here.
+	ids = [message["id"] for message in thread.get("messages", [])]
+	if ids:
+		db.execute(update(Email).where(Email.email_id.in_(ids), Email.thread_id.is_(None)).values(thread_id=thread["id"]))
+		db.commit()
+	return i
+
+
+def load_threads_to_db(num: int):
+	"""
+	Lists threads from gmail and loads the messages of every thread that changed since the last run.
+	A thread is skipped when its history id matches the one stored, otherwise all its messages come from one threads.get call.
+	"""
+	from googleapiclient.discovery import build
+
+	print("Loading email threads...")
+	creds = load_creds()
+	service = build("gmail", "v1", credentials=creds)
+	db = get_db()
+	archive = get_archive()
+	history = dict(db.execute(select(Thread.thread_id, Thread.history_id)).all())
+	next_page_token = ""
+	loaded, skipped, i = 0, 0, 0
+
+	while num > 0:
+		if not creds.valid:
+			creds = load_creds()
+			service = build("gmail", "v1", credentials=creds)
+		max_results = num if num < MAX_RESULTS else MAX_RESULTS
+		num -= max_results
+		results = service.users().threads().list(userId="me", pageToken=next_page_token, maxResults=str(max_results)).execute()
+
+		for listed in results.get("threads", []):
+			if history.get(listed["id"]) == listed["historyId"]:
+				skipped += 1
+				continue
+			thread = fetch_thread(service, listed["id"])
+			i += load_thread(thread, db, archive)
+			db.merge(Thread(thread_id=thread["id"], history_id=thread["historyId"]))
+			db.commit()
+			loaded += 1
+			# Notify for loaded threads on the o/p screen
+			if loaded % 25 == 0:
+				print(f"{loaded} threads with {i} emails have been loaded so far")
+
+		next_page_token = results.get("nextPageToken", "")
+		if not next_page_token:
+			break
+
+	if archive is not None:
+		archive.close()
+	print(f"Loaded {i} emails from {loaded} threads, {skipped} unchanged threads were skipped.")
+
+
 def load_emails_to_db():
 	"""
 	Goes through preloaded list of emails and fetches content of the email from gmail, parses it and loads the data into database.
@@ -107,6 +212,7 @@ def load_emails_to_db():
 	i = 0
 	DIR_EMAILS = os.environ.get("DIR_EMAILS")
 	db = get_db()
+	archive = get_archive()
 	if os.path.exists(DIR_EMAILS):
 		dir_email = Path(DIR_EMAILS)
 		for file in dir_email.iterdir():
@@ -114,7 +220,12 @@ def load_emails_to_db():
 				emails = json.load(fp)
 			 
 			for email in emails:
-				result = fetch_email(email['id'])
+				if archive is not None and email['id'] in archive:
+					result = archive.get(email['id'])
+				else:
+					result = fetch_email(email['id'])
+					if archive is not None:
+						archive.put(result)
 				parsed_email = parse_email(result)
 				if parsed_email:
 					load_email(parsed_email, db)
@@ -124,12 +235,16 @@ def load_emails_to_db():
 				# Notify for loaded emails on the o/p screen
 				if i !=0 and i%25 == 0:
 						print(f"{i} emails have been loaded so far")
+	if archive is not None:
+		archive.close()
 
 
 def fetch_emails(num: int):
 	"""
 	Fetches email list from gmail.
 	"""
+	from googleapiclient.discovery import build
+
 	print("Fetching email list...")
 	# Gets credentials using Google OAuth Client
 	creds = load_creds()
@@ -159,12 +274,174 @@ def fetch_emails(num: int):
 			break
 
 
-def load_emails(num):
+def reparse_archive():
+	"""
+	Rebuilds the emails table from the raw message archive without calling gmail.
+	Existing rows are updated in place so their ids stay stable, new ones are inserted.
+	"""
+	archive = get_archive()
+	if archive is None:
+		raise ValueError("DIR_ARCHIVE must point to the message archive to reparse.")
+
+	print(f"Reparsing {len(archive)} archived emails...")
+	db = get_db()
+	existing = dict(db.execute(select(Email.email_id, Email.id)).all())
+	to_update, to_insert = [], []
+	i = 0
+
+	# Rows are rewritten in place below the rule watermarks, so every rule re-evaluates all emails on its next
+	# run. Actions are only taken on emails that newly match. Cleared up front so a reparse stopped partway
+	# still leaves the rewritten rows to be re-evaluated.
+	db.execute(delete(RuleState))
+	db.commit()
+
+	def flush():
+		if to_update:
+			db.execute(update(Email), to_update)
+		if to_insert:
+			db.execute(insert(Email), to_insert)
+		db.commit()
+		to_update.clear()
+		to_insert.clear()
+
+	for raw in archive:
+		parsed_email = parse_email(raw)
+		if not parsed_email:
+			continue
+		columns = email_columns(parsed_email)
+		if columns["email_id"] in existing:
+			columns["id"] = existing[columns["email_id"]]
+			to_update.append(columns)
+		else:
+			# Guards against the same id being inserted twice within a run.
+			existing[columns["email_id"]] = None
+			to_insert.append(columns)
+		i += 1
+		if len(to_update) + len(to_insert) >= REPARSE_BATCH_SIZE:
+			flush()
+			print(f"{i} emails have been reparsed so far")
+
+	flush()
+	archive.close()
+	print(f"Reparsed {i} emails, rules will be re-evaluated against all emails on their next run.")
+
+
+def window_query(after, before):
+	"""
+	Gmail search query for a date window, a None bound leaves that side open.
+	Bounds overlap by a second so no message falls between windows.
+	"""
+	terms = []
+	if after is not None:
+		terms.append(f"after:{after - 1}")
+	if before is not None:
+		terms.append(f"before:{before + 1}")
+	return " ".join(terms)
+
+
+def list_window(service, after, before):
+	"""
+	Lists every message in a date window.
+	"""
+	messages = []
+	next_page_token = ""
+	while True:
+		results = service.users().messages().list(userId="me", q=window_query(after, before), pageToken=next_page_token, maxResults=str(MAX_RESULTS)).execute()
+		messages.extend(results.get("messages", []))
+		next_page_token = results.get("nextPageToken", "")
+		if not next_page_token:
+			return messages
+
+
+def estimate_window(service, after: int, before: int):
+	"""
+	Gmail's estimate of the number of messages in a date window.
+	"""
+	results = service.users().messages().list(userId="me", q=window_query(after, before), maxResults="1").execute()
+	return results.get("resultSizeEstimate", 0)
+
+
+def partition_windows(estimate, start: int, end: int, executor, target=WINDOW_TARGET):
+	"""
+	Splits [start, end) into date windows of roughly target messages each.
+	Windows are halved level by level, estimating every level concurrently, so dense periods get narrow windows.
+	"""
+	windows = []
+	frontier = [(start, end)]
+	while frontier:
+		counts = executor.map(lambda window: estimate(*window), frontier)
+		next_frontier = []
+		for (after, before), count in zip(frontier, counts):
+			if count == 0:
+				continue
+			if count <= target or before - after <= MIN_WINDOW_SECONDS:
+				windows.append((after, before))
+			else:
+				middle = (after + before) // 2
+				next_frontier.extend([(after, middle), (middle, before)])
+		frontier = next_frontier
+	return sorted(windows)
+
+
+def fetch_emails_partitioned(num: int, workers: int):
+	"""
+	Fetches email list from gmail by listing date windows concurrently.
+	Windows are merged newest first and de-duplicated, files are written in the same format as fetch_emails.
+	"""
+	from googleapiclient.discovery import build
+
+	print("Fetching email list in partitions...")
+	creds = load_creds()
+	local = threading.local()
+
+	def get_service():
+		# Gmail service objects are not thread safe, so each worker builds its own.
+		if not hasattr(local, "service"):
+			local.service = build("gmail", "v1", credentials=creds)
+		return local.service
+
+	messages = []
+	seen = set()
+	with ThreadPoolExecutor(max_workers=workers) as executor:
+		now = int(time.time()) + 1
+		windows = partition_windows(
+			lambda after, before: estimate_window(get_service(), after, before),
+			GMAIL_EPOCH, now, executor
+		)
+		# Open-ended edges catch mail imported with older dates and mail dated in the future by clock skew.
+		windows = [(now, None)] + windows[::-1] + [(None, GMAIL_EPOCH)]
+		print(f"Listing {len(windows)} date windows with {workers} workers.")
+		for window_messages in executor.map(lambda window: list_window(get_service(), *window), windows):
+			for message in window_messages:
+				if message["id"] not in seen:
+					seen.add(message["id"])
+					messages.append(message)
+			if len(messages) >= num:
+				executor.shutdown(wait=False, cancel_futures=True)
+				break
+
+	messages = messages[:num]
+	for i, start in enumerate(range(0, len(messages), MAX_RESULTS), start=1):
+		file_name = os.environ.get("DIR_EMAILS") + f"/emails-{i}.json"
+		with open(file_name, "w") as fp:
+			json.dump(messages[start:start + MAX_RESULTS], fp)
+	print(f"Listed {len(messages)} emails.")
+
+
+def load_emails(num, workers=0, threads=False):
 	"""
 	Loads emails to database.
 	"""
+	from googleapiclient.errors import HttpError
+
 	try:
-		fetch_emails(num)
+		if threads:
+			load_threads_to_db(num)
+			return
+		if workers > 0:
+			fetch_emails_partitioned(num, workers)
+		else:
+			fetch_emails(num)
 		load_emails_to_db()
 	except HttpError as error:
 		print(f"An error occurred: {error}")
@@ -179,6 +456,25 @@ def create_num_emails_parser():
         required=False, 
         help='Number of emails to fetch from Gmail'
     )
+    parser.add_argument(
+        '-r',
+        '--reparse',
+        action='store_true',
+        help='Rebuild the emails table from the archive in DIR_ARCHIVE instead of fetching from Gmail'
+    )
+    parser.add_argument(
+        '-w',
+        '--workers',
+        type=int,
+        default=0,
+        help='List the mailbox in date windows using this many concurrent workers'
+    )
+    parser.add_argument(
+        '-t',
+        '--threads',
+        action='store_true',
+        help='Load whole conversations with one call per thread, num is then the number of threads'
+    )
     return parser
 
 if __name__ == "__main__":
@@ -189,5 +485,8 @@ if __name__ == "__main__":
 	load_dotenv()
 	# Initialize database
 	init_db()
-	# Load Emails
-	load_emails(num)
+	if args.reparse:
+		reparse_archive()
+	else:
+		# Load Emails
+		load_emails(num, args.workers, args.threads)
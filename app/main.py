@@ -13,6 +13,12 @@ def create_file_parser():
         required=False, 
         help='Path to rule file'
     )
+    parser.add_argument(
+        '-f',
+        '--full',
+        action='store_true',
+        help='Re-evaluate the rule against every email instead of only new ones'
+    )
     return parser
 
 def main():
@@ -28,7 +34,7 @@ def main():
 
     try:
         composite_rule = create_composite_rule(path_to_rule)
-        composite_rule.apply()
+        composite_rule.apply(full=args.full)
     except Exception as e:
         print(f"Following error occured {e}")
 
@@ -0,0 +1,103 @@
+import argparse
+import datetime
+
+from sqlalchemy import MetaData, Table, Column, Integer, String, DateTime, select, func, insert, text
+from sqlalchemy.exc import DBAPIError
+from migrations import MIGRATIONS
+
+SCHEMA_VERSION_TABLE = "schema_version"
+HEAD = len(MIGRATIONS)
+# Arbitrary key for the postgres advisory lock serializing migrations across processes.
+MIGRATION_LOCK_ID = 7340133
+
+schema_version = Table(
+    SCHEMA_VERSION_TABLE,
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def current_version(engine):
+    """
+    Returns the applied schema version, 0 if the database has never been migrated.
+    """
+    try:
+        with engine.connect() as conn:
+            return applied_version(conn)
+    except DBAPIError:
+        # Version table doesn't exist yet.
+        return 0
+
+
+def applied_version(conn):
+    return conn.execute(select(func.max(schema_version.c.version))).scalar() or 0
+
+
+def lock(conn):
+    """
+    Holds the migration lock until the transaction ends, so concurrent starts apply each migration once.
+    """
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+
+
+def upgrade(engine, target=HEAD):
+    """
+    Applies pending migrations up to target, each one in its own transaction.
+    The version is re-read under the lock, another process may have applied migrations meanwhile.
+    """
+    with engine.begin() as conn:
+        lock(conn)
+        schema_version.create(conn, checkfirst=True)
+
+    while True:
+        with engine.begin() as conn:
+            lock(conn)
+            version = applied_version(conn)
+            if version >= target:
+                return version
+            migration = MIGRATIONS[version]
+            migration.upgrade(conn)
+            conn.execute(insert(schema_version).values(
+                version=version + 1,
+                description=migration.DESCRIPTION,
+                applied_at=datetime.datetime.now()
+            ))
+        print(f"Applied migration {version + 1}: {migration.DESCRIPTION}.")
+
+
+def ensure_schema(engine):
+    """
+    Startup check, a single version query when the schema is already at HEAD.
+    """
+    version = current_version(engine)
+    if version == HEAD:
+        return version
+    if version > HEAD:
+        raise RuntimeError(f"Database schema version {version} is newer than this code ({HEAD}).")
+    return upgrade(engine)
+
+
+def create_migrate_parser():
+    parser = argparse.ArgumentParser(description='Apply database schema migrations.')
+    parser.add_argument(
+        '-s',
+        '--status',
+        action='store_true',
+        help='Only print the current and latest schema version'
+    )
+    return parser
+
+
+if __name__ == "__main__":
+    from db import get_engine
+
+    parser = create_migrate_parser()
+    args = parser.parse_args()
+    engine = get_engine()
+    if args.status:
+        print(f"Schema version {current_version(engine)}, latest {HEAD}.")
+    else:
+        print(f"Schema is at version {upgrade(engine)}.")
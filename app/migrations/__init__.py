@@ -0,0 +1,22 @@
+"""
+Ordered schema migrations. The position of a module in MIGRATIONS is its version,
+so new migrations must only ever be appended.
+"""
+import os
+
+from migrations import v0001_baseline, v0002_threads, v0003_rule_matches, v0004_sender, v0005_pending_matches
+
+MIGRATIONS = [
+    v0001_baseline,
+    v0002_threads,
+    v0003_rule_matches,
+    v0004_sender,
+    v0005_pending_matches,
+]
+
+
+def email_table():
+    """
+    Name of the emails table, migrations use it instead of the model so they stay frozen in time.
+    """
+    return os.environ.get("DB_TABLE_NAME")
@@ -0,0 +1,25 @@
+"""
+Creates the emails table as it was before versioned migrations existed.
+"""
+from sqlalchemy import MetaData, Table, Column, Integer, String, Numeric, Index
+
+DESCRIPTION = "baseline emails table"
+
+
+def upgrade(conn):
+    from migrations import email_table
+    name = email_table()
+    table = Table(
+        name,
+        MetaData(),
+        Column("id", Integer, primary_key=True),
+        Column("email_id", String, nullable=False),
+        Column("message", String, nullable=False),
+        Column("date", Numeric, nullable=False),
+        Column("subject", String, nullable=False),
+        Column("recv_from", String, nullable=False),
+    )
+    # checkfirst keeps databases created by the old create_all() startup intact.
+    table.create(conn, checkfirst=True)
+    Index(f"ix_{name}_id", table.c.id).create(conn, checkfirst=True)
+    Index(f"ix_{name}_email_id", table.c.email_id).create(conn, checkfirst=True)
@@ -0,0 +1,25 @@
+"""
+Adds thread id to emails and a table remembering the last seen history id of every thread.
+"""
+from sqlalchemy import MetaData, Table, Column, String, Index, text
+
+DESCRIPTION = "email thread ids and thread history"
+
+
+def upgrade(conn):
+    from migrations import email_table
+    name = email_table()
+    quote = conn.dialect.identifier_preparer.quote
+    conn.execute(text(f"ALTER TABLE {quote(name)} ADD COLUMN thread_id VARCHAR"))
+
+    metadata = MetaData()
+    emails = Table(name, metadata, Column("thread_id", String))
+    Index(f"ix_{name}_thread_id", emails.c.thread_id).create(conn)
+
+    threads = Table(
+        f"{name}_threads",
+        metadata,
+        Column("thread_id", String, primary_key=True),
+        Column("history_id", String, nullable=False),
+    )
+    threads.create(conn)
@@ -0,0 +1,30 @@
+"""
+Adds per rule evaluation state and materialized match sets for incremental rule evaluation.
+"""
+from sqlalchemy import MetaData, Table, Column, Integer, String, Numeric, Index
+
+DESCRIPTION = "rule watermarks and match sets"
+
+
+def upgrade(conn):
+    from migrations import email_table
+    name = email_table()
+    metadata = MetaData()
+
+    # Date relative rules re-check rows by date range.
+    emails = Table(name, metadata, Column("date", Numeric))
+    Index(f"ix_{name}_date", emails.c.date).create(conn)
+
+    Table(
+        f"{name}_rule_state",
+        metadata,
+        Column("rule_key", String, primary_key=True),
+        Column("watermark", Integer, nullable=False),
+        Column("reference_date", Numeric, nullable=False),
+    ).create(conn)
+    Table(
+        f"{name}_rule_matches",
+        metadata,
+        Column("rule_key", String, primary_key=True),
+        Column("email_row_id", Integer, primary_key=True),
+    ).create(conn)
@@ -0,0 +1,13 @@
+"""
+Marks rule matches whose actions haven't succeeded yet, so they are retried on the next run.
+"""
+from sqlalchemy import text
+
+DESCRIPTION = "pending rule matches"
+
+
+def upgrade(conn):
+    from migrations import email_table
+    quote = conn.dialect.identifier_preparer.quote
+    # Existing matches had their actions taken already.
+    conn.execute(text(f"ALTER TABLE {quote(email_table() + '_rule_matches')} ADD COLUMN pending BOOLEAN NOT NULL DEFAULT FALSE"))
@@ -1,6 +1,6 @@
 import os
 
-from sqlalchemy import Column, Integer, String, Numeric
+from sqlalchemy import Column, Integer, String, Numeric, Boolean, false
 from db import Base
 
 class Email(Base):
@@ -9,9 +9,47 @@ class Email(Base):
     id = Column(Integer, primary_key=True, index=True)
     email_id = Column(String, nullable=False, index=True)
     message = Column(String, nullable=False)
-    date = Column(Numeric, nullable=False)
+    date = Column(Numeric, nullable=False, index=True)
     subject = Column(String, nullable=False)
     recv_from = Column(String, nullable=False)
+    thread_id = Column(String, nullable=True, index=True)
+    from_address = Column(String, nullable=False, index=True, server_default="")
+    from_domain = Column(String, nullable=False, index=True, server_default="")
 
     def __repr__(self):
-        return f"<Email(id={self.id}, subject={self.subject}, date={self.date})>"
\ No newline at end of file
+        return f"<Email(id={self.id}, subject={self.subject}, date={self.date})>"
+
+
+class Thread(Base):
+    __tablename__ = f'{os.environ.get("DB_TABLE_NAME")}_threads'
+
+    thread_id = Column(String, primary_key=True)
+    history_id = Column(String, nullable=False)
+
+    def __repr__(self):
+        return f"<Thread(thread_id={self.thread_id}, history_id={self.history_id})>"
+
+
+class RuleState(Base):
+    __tablename__ = f'{os.environ.get("DB_TABLE_NAME")}_rule_state'
+
+    rule_key = Column(String, primary_key=True)
+    # Highest Email.id the rule has been evaluated against.
+    watermark = Column(Integer, nullable=False)
+    # Midnight timestamp date relative rules were last evaluated with.
+    reference_date = Column(Numeric, nullable=False)
+
+    def __repr__(self):
+        return f"<RuleState(rule_key={self.rule_key}, watermark={self.watermark})>"
+
+
+class RuleMatch(Base):
+    __tablename__ = f'{os.environ.get("DB_TABLE_NAME")}_rule_matches'
+
+    rule_key = Column(String, primary_key=True)
+    email_row_id = Column(Integer, primary_key=True)
+    # True until every action of the rule has succeeded on the email.
+    pending = Column(Boolean, nullable=False, server_default=false())
+
+    def __repr__(self):
+        return f"<RuleMatch(rule_key={self.rule_key}, email_row_id={self.email_row_id}, pending={self.pending})>"
\ No newline at end of file
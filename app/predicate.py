@@ -22,6 +22,14 @@ class NotEquals(Predicate):
     def __call__(self, field, value):
         return not_(getattr(Email, field).__eq__(value))
     
+class In(Predicate):
+    def __call__(self, field, value):
+        return getattr(Email, field).in_(value)
+
+class NotIn(Predicate):
+    def __call__(self, field, value):
+        return getattr(Email, field).not_in(value)
+
 class LessThan(Predicate):
     def __call__(self, field, value):
         return getattr(Email, field).__lt__(value)
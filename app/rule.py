@@ -1,16 +1,26 @@
 import datetime
+import hashlib
 import os
 import json
 
 from abc import ABC, abstractmethod
 from typing import Union
-from sqlalchemy import select
-from models import Email
+from sqlalchemy import select, delete, insert, update, exists, and_, not_, or_, func
+from models import Email, RuleState, RuleMatch
 from db import SessionLocal
 from action import Action
-from predicate import Predicate, Contains, NotContains, NotEquals, Equals, All, Any, LessThan, GreaterThan
+from predicate import Predicate, Contains, NotContains, NotEquals, Equals, In, NotIn, All, Any, LessThan, GreaterThan
 
-Fields = set(["recv_from", "subject", "message", "date"])
+Fields = set(["recv_from", "subject", "message", "date", "from_address", "from_domain"])
+DAY_MS = 60*60*24*1000
+# Number of ids below the watermark evaluated again on every run, covers ids committed out of order.
+WATERMARK_LAG = 10000
+
+def today_timestamp():
+    """
+    Timestamp of today's midnight in milliseconds, date relative rules count days from it.
+    """
+    return datetime.datetime.combine(datetime.datetime.today(), datetime.time.min).timestamp() * 1000
 
 class Rule(ABC):
     """
@@ -56,6 +66,36 @@ class StringRule(Rule):
         super().__init__(predicate, field, value)
 
 
+class SenderRule(Rule):
+    """
+    Rule for the normalized sender address and domain, compiles to index lookups.
+    """
+    @property
+    def SUPPORTED_PREDICATES(self):
+        return (Equals, NotEquals, In, NotIn)
+
+    @property
+    def SUPPORTED_FIELDS(self):
+        return ("from_address", "from_domain")
+
+    def __init__(self, predicate: Predicate, field: str, value: Union[str, list[str]]):
+        if isinstance(predicate, (In, NotIn)):
+            if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+                raise ValueError("Value must be a list of strings.")
+            # Sorted and de-duplicated so large allow/deny lists give a stable rule key.
+            value = sorted(set(self.normalize(field, item) for item in value))
+        else:
+            if not isinstance(value, str):
+                raise ValueError("Value must be a string")
+            value = self.normalize(field, value)
+        super().__init__(predicate, field, value)
+
+    @staticmethod
+    def normalize(field, value):
+        value = value.strip().lower()
+        return value.lstrip("@") if field == "from_domain" else value
+
+
 class DateRule(Rule):
     """
     Rule for date specific conditions.
@@ -71,8 +111,8 @@ class DateRule(Rule):
     def __init__(self, predicate: Predicate, field: str, value: int):
         if not isinstance(value, int):
             raise ValueError("Value must be an integer.")
-        today_timestamp = datetime.datetime.combine(datetime.datetime.today(), datetime.time.min).timestamp() * 1000
-        value = today_timestamp - value * (60*60*24*1000)
+        self.days = value
+        value = today_timestamp() - value * DAY_MS
         super().__init__(predicate, field, value)
 
 
@@ -95,25 +135,121 @@ class CompositeRule:
             raise ValueError("All rules must be of type Rule.")
         
 
-    def execute(self):
-        query = select(Email.email_id, Email.id).where(
-            self.predicate('', [rule.predicate(rule.field, rule.value) for rule in self.rules])
-        )
+    @property
+    def key(self):
+        """
+        Stable identity of the rule, used to keep its watermark and match set between runs.
+        Actions are part of it so changing them re-applies the rule to every match.
+        """
+        schema = [
+            type(self.predicate).__name__,
+            [[type(rule.predicate).__name__, rule.field, rule.days if isinstance(rule, DateRule) else rule.value] for rule in self.rules],
+            [[action.action, action.param] for action in self.actions]
+        ]
+        return hashlib.sha256(json.dumps(schema).encode()).hexdigest()
+
+    def condition(self):
+        return self.predicate('', [rule.predicate(rule.field, rule.value) for rule in self.rules])
+
+    def date_bands(self, reference_date):
+        """
+        Date ranges whose emails may have changed result since the rule was evaluated at reference_date.
+        """
+        bands = []
+        for rule in self.rules:
+            if isinstance(rule, DateRule):
+                old = float(reference_date) - rule.days * DAY_MS
+                if old != rule.value:
+                    bands.append(Email.date.between(min(old, rule.value), max(old, rule.value)))
+        return bands
+
+    def evaluate_incremental(self, session):
+        """
+        Updates the materialized match set of the rule and returns the (email_id, id) of newly matched emails.
+        Only emails inserted after the watermark are evaluated, plus older emails whose date crossed a
+        date rule boundary since the last run. Without a watermark every email is evaluated and stale
+        matches are dropped, new matches are added as pending.
+        """
+        key = self.key
+        condition = self.condition()
+        reference_date = today_timestamp()
+        head = session.execute(select(func.max(Email.id))).scalar() or 0
+        state = session.get(RuleState, key)
+        watermark = state.watermark if state else 0
+        # Emails re-evaluated in the lag range that are matched already are excluded below.
+        low = max(watermark - WATERMARK_LAG, 0)
+        # Correlated exists probes the primary key per row, postgres can't turn NOT IN (subquery) into an anti join.
+        unmatched = ~exists().where(RuleMatch.rule_key == key, RuleMatch.email_row_id == Email.id)
+        scopes = [and_(Email.id > low, Email.id <= head)]
+
+        if state is None:
+            session.execute(delete(RuleMatch).where(
+                RuleMatch.rule_key == key,
+                ~exists().where(Email.id == RuleMatch.email_row_id, condition)
+            ))
+        else:
+            bands = self.date_bands(state.reference_date)
+            if bands:
+                session.execute(delete(RuleMatch).where(
+                    RuleMatch.rule_key == key,
+                    exists().where(Email.id == RuleMatch.email_row_id, Email.id <= watermark, or_(*bands), not_(condition))
+                ))
+                scopes.append(and_(Email.id <= low, or_(*bands)))
+
+        added = session.execute(
+            select(Email.email_id, Email.id).where(or_(*scopes), condition, unmatched).order_by(Email.id)
+        ).all()
+        if added:
+            session.execute(insert(RuleMatch), [{"rule_key": key, "email_row_id": id, "pending": True} for (_, id) in added])
+        session.merge(RuleState(rule_key=key, watermark=max(head, watermark), reference_date=reference_date))
+        return added
+
+    def reset(self, session):
+        """
+        Forgets the watermark and match set so the next run evaluates every email and takes actions on all matches again.
+        """
+        key = self.key
+        session.execute(delete(RuleMatch).where(RuleMatch.rule_key == key))
+        session.execute(delete(RuleState).where(RuleState.rule_key == key))
+
+    def pending(self, session):
+        """
+        Returns (email_id, id) of matched emails whose actions haven't all succeeded yet.
+        """
+        return session.execute(
+            select(Email.email_id, Email.id)
+            .join(RuleMatch, RuleMatch.email_row_id == Email.id)
+            .where(RuleMatch.rule_key == self.key, RuleMatch.pending)
+            .order_by(Email.id)
+        ).all()
+
+    def apply(self, full=False):
         session = SessionLocal()
-        results = session.execute(query).all()
-        return results
-    
-    def apply(self):
-        results = self.execute()
+        if full:
+            self.reset(session)
+        self.evaluate_incremental(session)
+        session.commit()
+
+        results = self.pending(session)
         ids = [email_id for (email_id, _) in results]
         if len(ids) == 0:
-            print("No emails found for this rule.")
+            print("No new emails found for this rule.")
             return
-        
+
         print(f"Following emails have been filtered by the rule: {ids}.")
         print("Applying actions...")
+        # An email is done once every action succeeded on it, the rest stay pending and are retried next run.
+        done = set(ids)
         for action in self.actions:
-            action(ids)
+            done &= set(action(ids))
+        done_rows = [id for (email_id, id) in results if email_id in done]
+        if done_rows:
+            session.execute(update(RuleMatch).where(
+                RuleMatch.rule_key == self.key, RuleMatch.email_row_id.in_(done_rows)
+            ).values(pending=False))
+        session.commit()
+        if len(done) < len(ids):
+            print(f"Actions failed for {len(ids) - len(done)} emails, they will be retried on the next run.")
 
 
 def create_predicate(predicate):
@@ -122,6 +258,8 @@ def create_predicate(predicate):
         'notcontains': NotContains(), 
         'equals': Equals(), 
         'notequals': NotEquals(), 
+        'in': In(),
+        'notin': NotIn(),
         'any': Any(), 
         'all': All(), 
         'ltndays': GreaterThan(), 
@@ -144,6 +282,12 @@ def create_rule(schema):
             field=schema["field"],
             value=schema["value"]
         )
+    elif schema['field'] in ('from_address', 'from_domain'):
+        return SenderRule(
+            predicate=create_predicate(schema["predicate"]),
+            field=schema["field"],
+            value=schema["value"]
+        )
     else:
         return StringRule(
             predicate=create_predicate(schema["predicate"]),
@@ -164,6 +308,9 @@ def create_composite_rule(file_path):
     with open(file_path, 'r') as fp:
         rule_schema = json.load(fp)
 
+    return create_composite_rule_from_schema(rule_schema)
+
+def create_composite_rule_from_schema(rule_schema):
     req_keys = {"predicate", "actions", "rules"}
     if req_keys != set(rule_schema.keys()):
         raise ValueError("Properties required to create Composite Rule are not present")
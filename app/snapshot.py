@@ -0,0 +1,194 @@
+import re
+import numpy as np
+
+from itertools import islice
+from numpy.dtypes import StringDType
+from sqlalchemy import select
+from models import Email
+from rule import Rule, CompositeRule
+from predicate import Contains, NotContains, Equals, NotEquals, In, NotIn, LessThan, GreaterThan, All, Any
+
+STRING_FIELDS = ("email_id", "recv_from", "subject", "message", "from_address", "from_domain")
+EXPORT_BATCH_SIZE = 10000
+# Emails per chunk when counting overlaps, bounds the float matrix to rules x chunk.
+OVERLAP_CHUNK_SIZE = 16384
+
+
+class Snapshot:
+    """
+    Columnar in-memory copy of the emails table that evaluates rules as vectorized column operations.
+    """
+    def __init__(self, columns: dict[str, np.ndarray]) -> None:
+        self.columns = columns
+        self._lowered: dict[str, np.ndarray] = {}
+        self._masks: dict[tuple, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self.columns["id"])
+
+    @classmethod
+    def from_rows(cls, rows, batch_size=EXPORT_BATCH_SIZE):
+        """
+        Builds snapshot from (id, date, email_id, recv_from, subject, message, from_address, from_domain) rows.
+        Rows are converted batch by batch, so only one batch is held as Python objects at a time.
+        """
+        rows = iter(rows)
+        batches = []
+        while batch := list(islice(rows, batch_size)):
+            batches.append(cls.columns_of(batch))
+        if not batches:
+            return cls(cls.columns_of([]))
+        return cls({field: np.concatenate([batch[field] for batch in batches]) for field in batches[0]})
+
+    @staticmethod
+    def columns_of(rows):
+        columns = {
+            "id": np.array([row[0] for row in rows], dtype=np.int64),
+            "date": np.array([float(row[1]) for row in rows], dtype=np.float64),
+        }
+        for i, field in enumerate(STRING_FIELDS, start=2):
+            columns[field] = np.array([row[i] for row in rows], dtype=StringDType())
+        return columns
+
+    @classmethod
+    def export(cls, db):
+        """
+        Reads the emails table into a snapshot.
+        """
+        query = select(
+            Email.id, Email.date, Email.email_id, Email.recv_from, Email.subject, Email.message, Email.from_address, Email.from_domain
+        ).order_by(Email.id)
+        return cls.from_rows(db.execute(query.execution_options(yield_per=EXPORT_BATCH_SIZE)))
+
+    def save(self, path):
+        """
+        Writes snapshot as .npz. Strings are stored Arrow style as utf-8 data plus offsets.
+        """
+        arrays = {"id": self.columns["id"], "date": self.columns["date"]}
+        for field in STRING_FIELDS:
+            encoded = [value.encode() for value in self.columns[field]]
+            arrays[f"{field}.offsets"] = np.cumsum([0] + [len(value) for value in encoded], dtype=np.int64)
+            arrays[f"{field}.data"] = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        with open(path, "wb") as fp:
+            np.savez(fp, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            columns = {"id": arrays["id"], "date": arrays["date"]}
+            for field in STRING_FIELDS:
+                data = arrays[f"{field}.data"].tobytes()
+                offsets = arrays[f"{field}.offsets"].tolist()
+                columns[field] = np.array(
+                    [data[offsets[i]:offsets[i + 1]].decode() for i in range(len(offsets) - 1)],
+                    dtype=StringDType()
+                )
+        return cls(columns)
+
+    def lowered(self, field):
+        """
+        Lower cased column, computed once and shared by every case insensitive predicate.
+        """
+        if field not in self._lowered:
+            self._lowered[field] = np.strings.lower(self.columns[field])
+        return self._lowered[field]
+
+    def mask(self, rule: Rule) -> np.ndarray:
+        """
+        Boolean mask of the emails matched by a single rule, memoized since candidate rules share conditions.
+        """
+        value = tuple(rule.value) if isinstance(rule.value, list) else rule.value
+        key = (type(rule.predicate), rule.field, value)
+        if key not in self._masks:
+            evaluate = VECTORIZED_PREDICATES[type(rule.predicate)]
+            self._masks[key] = evaluate(self, rule.field, rule.value)
+        return self._masks[key]
+
+    def evaluate(self, composite_rule: CompositeRule) -> np.ndarray:
+        """
+        Boolean mask of the emails matched by a composite rule.
+        """
+        masks = [self.mask(rule) for rule in composite_rule.rules]
+        if len(masks) == 0:
+            # Matches SQL semantics of an empty and_() / or_().
+            return np.full(len(self), isinstance(composite_rule.predicate, All))
+        if isinstance(composite_rule.predicate, All):
+            return np.logical_and.reduce(masks)
+        if isinstance(composite_rule.predicate, Any):
+            return np.logical_or.reduce(masks)
+        raise ValueError(f"Predicate must be one of {CompositeRule.SUPPORTED_PREDICATES}")
+
+
+def like_to_regex(value):
+    """
+    Translates a LIKE pattern to a regex, % matches any run and _ any one character.
+    Backslash escapes the next character as in postgres.
+    """
+    pattern = []
+    chars = iter(value)
+    for char in chars:
+        if char == "\\":
+            pattern.append(re.escape(next(chars, "\\")))
+        elif char == "%":
+            pattern.append(".*")
+        elif char == "_":
+            pattern.append(".")
+        else:
+            pattern.append(re.escape(char))
+    return re.compile("".join(pattern), re.DOTALL)
+
+def contains(snapshot, field, value):
+    # Production uses ilike('%value%'), so matching is case insensitive and value is a LIKE pattern.
+    value = value.lower()
+    column = snapshot.lowered(field)
+    if not any(char in value for char in "%_\\"):
+        return np.strings.find(column, value) >= 0
+    pattern = like_to_regex(value)
+    return np.fromiter((pattern.search(text) is not None for text in column), dtype=bool, count=len(column))
+
+def not_contains(snapshot, field, value):
+    return ~contains(snapshot, field, value)
+
+def equals(snapshot, field, value):
+    return snapshot.columns[field] == value
+
+def not_equals(snapshot, field, value):
+    return snapshot.columns[field] != value
+
+def is_in(snapshot, field, value):
+    return np.isin(snapshot.columns[field], np.array(value, dtype=StringDType()))
+
+def not_in(snapshot, field, value):
+    return ~is_in(snapshot, field, value)
+
+def less_than(snapshot, field, value):
+    return snapshot.columns[field] < value
+
+def greater_than(snapshot, field, value):
+    return snapshot.columns[field] > value
+
+
+VECTORIZED_PREDICATES = {
+    Contains: contains,
+    NotContains: not_contains,
+    Equals: equals,
+    NotEquals: not_equals,
+    In: is_in,
+    NotIn: not_in,
+    LessThan: less_than,
+    GreaterThan: greater_than,
+}
+
+
+def overlap_matrix(masks: list[np.ndarray]) -> np.ndarray:
+    """
+    Number of emails matched by both rule i and rule j, the diagonal holds match counts.
+    """
+    overlaps = np.zeros((len(masks), len(masks)), dtype=np.int64)
+    if len(masks) == 0:
+        return overlaps
+    for start in range(0, len(masks[0]), OVERLAP_CHUNK_SIZE):
+        # float32 counts are exact up to 2**24, far above the chunk size, and use BLAS for the product.
+        chunk = np.stack([mask[start:start + OVERLAP_CHUNK_SIZE] for mask in masks]).astype(np.float32)
+        overlaps += np.rint(chunk @ chunk.T).astype(np.int64)
+    return overlaps
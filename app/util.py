@@ -1,8 +1,6 @@
 import os.path
 
-from google.oauth2.credentials import Credentials
-from google.auth.transport.requests import Request
-from google_auth_oauthlib.flow import InstalledAppFlow
+from email.utils import parseaddr
 
 # If modifying these scopes, delete the file token.json.
 SCOPES = ["https://www.googleapis.com/auth/gmail.readonly", "https://www.googleapis.com/auth/gmail.modify"]
@@ -11,6 +9,11 @@ def load_creds():
 	"""
 	Loads token from Google OAuth to be used by google client to access the apis.
 	"""
+	# Google auth libraries are heavy to import, so pay for them only when credentials are needed.
+	from google.oauth2.credentials import Credentials
+	from google.auth.transport.requests import Request
+	from google_auth_oauthlib.flow import InstalledAppFlow
+
 	creds = None
 	# The file at PATH_TOKENS stores the user's access and refresh tokens, and is
 	# created automatically when the authorization flow completes for the first
@@ -30,4 +33,15 @@ def load_creds():
 		with open(os.environ.get('PATH_TOKENS'), "w") as token:
 			token.write(creds.to_json())
 
-	return creds
\ No newline at end of file
+	return creds
+
+
+def parse_sender(recv_from):
+	"""
+	Extracts normalized address and domain from a From header, e.g. "Name <A@B.com>" gives ("a@b.com", "b.com").
+	"""
+	_, address = parseaddr(recv_from or "")
+	address = address.strip().lower()
+	if "@" not in address:
+		return "", ""
+	return address, address.rpartition("@")[2]
@@ -0,0 +1,21 @@
+import pytest
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from app import migrate
+
+# Models and migrations take the emails table name from DB_TABLE_NAME, which db.py loads from .env
+# when models are first imported. Tests use that same name, so they don't override it.
+
+
+@pytest.fixture
+def engine():
+    return create_engine("sqlite://")
+
+
+@pytest.fixture
+def db(engine):
+    """Session on an in-memory database migrated to the latest schema."""
+    migrate.ensure_schema(engine)
+    with Session(engine) as session:
+        yield session
@@ -0,0 +1,25 @@
+import base64
+
+from rule import create_composite_rule_from_schema
+
+
+def make_message(id, thread_id=None, data=None):
+    """Raw gmail message as returned by messages.get."""
+    return {
+        "id": id,
+        "threadId": thread_id or id,
+        "internalDate": "1700000000000",
+        "payload": {
+            "headers": [{"name": "From", "value": "a@b.com"}, {"name": "Subject", "value": "hi"}],
+            "body": {"data": data or base64.urlsafe_b64encode(b"hello").decode()}
+        }
+    }
+
+
+def make_rule(predicate, *rules, actions=()):
+    """Composite rule from (field, predicate, value) tuples."""
+    return create_composite_rule_from_schema({
+        "predicate": predicate,
+        "actions": [{"action": action, "value": value} for (action, value) in actions],
+        "rules": [{"field": field, "value": value, "predicate": p} for (field, p, value) in rules]
+    })
@@ -105,6 +105,29 @@ class TestAction:
             data='{"ids": ["msg1", "msg2"], "addLabelIds": ["INBOX"]}'
         )
 
+    @patch('google.oauth2.credentials.Credentials.from_authorized_user_file')
+    @patch('os.path.exists')
+    @patch('requests.post')
+    def test_action_reports_succeeded_chunks(self, mock_post, mock_exists,  mock_creds):
+        """Test that every chunk is sent and only ids of successful chunks are returned."""
+
+        mock_exists = True
+        # Mock credentials
+        fake_creds = MagicMock()
+        mock_creds.return_value = fake_creds
+        fake_creds.valid = True
+        fake_creds.token = "fake_token"
+
+        # First chunk succeeds, second fails
+        mock_post.side_effect = [MagicMock(status_code=200), MagicMock(status_code=500)]
+
+        ids = [f"msg{i}" for i in range(1500)]
+        action = Action(action='mark_as_read')
+        succeeded = action(ids)
+
+        assert mock_post.call_count == 2
+        assert succeeded == ids[:1000]
+
     def test_invalid_action(self):
         """Test initialization with an invalid action."""
         with pytest.raises(ValueError, match=r"invalid_action .*"):
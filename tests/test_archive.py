@@ -0,0 +1,64 @@
+import pytest
+
+from app.archive import MessageArchive
+from tests.helpers import make_message
+
+
+def test_put_and_get(tmp_path):
+    """Test that archived messages are returned unchanged."""
+    archive = MessageArchive(tmp_path)
+    message = make_message("msg1")
+
+    assert archive.put(message)
+
+    assert "msg1" in archive
+    assert archive.get("msg1") == message
+    archive.close()
+
+
+def test_same_content_is_stored_once(tmp_path):
+    """Test that re-archiving identical content is a no-op and changed content replaces it."""
+    archive = MessageArchive(tmp_path)
+    archive.put(make_message("msg1"))
+
+    assert not archive.put(make_message("msg1"))
+    assert archive.put(make_message("msg1", data="d29ybGQ="))
+    assert archive.get("msg1")["payload"]["body"]["data"] == "d29ybGQ="
+    assert len(archive) == 1
+    archive.close()
+
+
+def test_index_is_reloaded_and_segments_roll_over(tmp_path):
+    """Test that a reopened archive finds messages across several segments."""
+    archive = MessageArchive(tmp_path, segment_size=200)
+    for i in range(10):
+        archive.put(make_message(f"msg{i}"))
+    archive.close()
+
+    assert len(list(tmp_path.glob("segment-*.bin"))) > 1
+
+    reopened = MessageArchive(tmp_path, segment_size=200)
+    assert [message["id"] for message in reopened] == [f"msg{i}" for i in range(10)]
+    reopened.close()
+
+
+def test_torn_index_line_is_discarded(tmp_path):
+    """Test that an interrupted index write doesn't merge with the next entry."""
+    archive = MessageArchive(tmp_path)
+    archive.put(make_message("msg1"))
+    archive.close()
+    with open(tmp_path / "index.tsv", "a") as fp:
+        fp.write("msg2\tdead")
+
+    reopened = MessageArchive(tmp_path)
+    reopened.put(make_message("msg3"))
+    reopened.close()
+
+    final = MessageArchive(tmp_path)
+    assert sorted(final.index) == ["msg1", "msg3"]
+    assert final.get("msg3")["id"] == "msg3"
+    final.close()
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,210 @@
+import json
+import re
+import time
+import pytest
+
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch, MagicMock
+from app import load_emails
+from app.archive import MessageArchive
+from models import Email, Thread, RuleState
+from tests.helpers import make_message
+
+DAY = 60 * 60 * 24
+
+
+def make_estimate(dates):
+    """Counts messages in a window the way gmail's estimate would."""
+    def estimate(after, before):
+        return sum(1 for date in dates if after <= date < before)
+    return estimate
+
+
+def test_partition_windows_adapts_to_density():
+    """Test that dense periods are split into narrower windows than sparse ones."""
+    # 10 messages in the first 100 days, 400 in the last day.
+    dates = [i * 10 * DAY for i in range(10)] + [100 * DAY + i * 200 for i in range(400)]
+    estimate = make_estimate(dates)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        windows = load_emails.partition_windows(estimate, 0, 101 * DAY, executor, target=50)
+
+    counts = [estimate(after, before) for (after, before) in windows]
+    assert sum(counts) == len(dates)
+    assert all(count <= 50 for count in counts)
+    assert windows == sorted(windows)
+    # Windows never overlap.
+    assert all(windows[i][1] <= windows[i + 1][0] for i in range(len(windows) - 1))
+    widths = {(after, before): before - after for (after, before) in windows}
+    assert widths[windows[0]] > widths[windows[-1]]
+
+
+def test_partition_windows_skips_empty_ranges():
+    """Test that windows without messages are dropped."""
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        windows = load_emails.partition_windows(make_estimate([]), 0, 100 * DAY, executor)
+
+    assert windows == []
+
+
+def test_partition_windows_stops_at_min_width():
+    """Test that a window denser than the target is kept once it can't be split further."""
+    dates = [DAY] * 100
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        windows = load_emails.partition_windows(make_estimate(dates), 0, 2 * DAY, executor, target=10)
+
+    assert len(windows) == 1
+    assert windows[0][1] - windows[0][0] <= load_emails.MIN_WINDOW_SECONDS
+
+
+@patch('googleapiclient.discovery.build')
+@patch('app.load_emails.get_archive', return_value=None)
+@patch('app.load_emails.load_creds')
+def test_load_threads_skips_unchanged_threads(mock_creds, mock_archive, mock_build, db):
+    """Test that threads are fetched with threads.get once, skipped while their history id is unchanged and set on existing emails."""
+    db.add(Thread(thread_id="t2", history_id="20"))
+    # Loaded before thread ids were stored.
+    load_emails.load_email(dict(load_emails.parse_email(make_message("m1")), thread_id=None), db)
+
+    threads = mock_build.return_value.users.return_value.threads.return_value
+    threads.list.return_value.execute.return_value = {
+        "threads": [{"id": "t1", "historyId": "10"}, {"id": "t2", "historyId": "20"}]
+    }
+    threads.get.return_value.execute.return_value = {
+        "id": "t1", "historyId": "10", "messages": [make_message("m1", "t1"), make_message("m2", "t1")]
+    }
+
+    with patch('app.load_emails.get_db', return_value=db):
+        load_emails.load_threads_to_db(10)
+
+    threads.get.assert_called_once_with(userId="me", id="t1")
+    db.expire_all()
+    assert sorted((email.email_id, email.thread_id) for email in db.query(Email)) == [("m1", "t1"), ("m2", "t1")]
+    assert db.get(Thread, "t1").history_id == "10"
+
+
+def make_list_service(dates):
+    """Gmail service whose messages.list filters {id: date in seconds} by after:/before: and pages results."""
+    def list(userId, q, maxResults, pageToken=""):
+        after = re.search(r"after:(-?\d+)", q)
+        before = re.search(r"before:(-?\d+)", q)
+        ids = sorted(
+            (id for (id, date) in dates.items()
+             if (after is None or date > int(after.group(1))) and (before is None or date < int(before.group(1)))),
+            key=lambda id: -dates[id]
+        )
+        start, size = int(pageToken or 0), int(maxResults)
+        results = {"messages": [{"id": id} for id in ids[start:start + size]], "resultSizeEstimate": len(ids)}
+        if start + size < len(ids):
+            results["nextPageToken"] = str(start + size)
+        response = MagicMock()
+        response.execute.return_value = results
+        return response
+
+    service = MagicMock()
+    service.users.return_value.messages.return_value.list.side_effect = list
+    return service
+
+
+def listed_ids(dir_emails):
+    files = sorted(dir_emails.iterdir(), key=lambda file: int(file.stem.split("-")[1]))
+    return [message["id"] for file in files for message in json.loads(file.read_text())]
+
+
+@pytest.mark.parametrize("num, expected", [
+    (100, ["future", "new2", "new1", "mid", "old", "imported"]),
+    (3, ["future", "new2", "new1"]),
+])
+def test_fetch_emails_partitioned_merges_windows(tmp_path, monkeypatch, num, expected):
+    """Test that windows are merged newest first, de-duplicated and truncated, including mail outside the sized range."""
+    now = int(time.time())
+    dates = {
+        "imported": load_emails.GMAIL_EPOCH - 100 * DAY,
+        # Listed by both the open-ended edge window and the first sized window.
+        "old": load_emails.GMAIL_EPOCH,
+        "mid": now - 1000 * DAY,
+        "new1": now - 2 * DAY,
+        "new2": now - DAY,
+        "future": now + 10 * DAY,
+    }
+    monkeypatch.setenv("DIR_EMAILS", str(tmp_path))
+    monkeypatch.setattr(load_emails, "MAX_RESULTS", 2)
+
+    with patch('googleapiclient.discovery.build', return_value=make_list_service(dates)), \
+            patch('app.load_emails.load_creds'):
+        load_emails.fetch_emails_partitioned(num, workers=3)
+
+    assert listed_ids(tmp_path) == expected
+
+
+def test_load_emails_reads_archived_messages(db, tmp_path, monkeypatch):
+    """Test that archived messages aren't fetched again and fetched ones are archived."""
+    archive = MessageArchive(tmp_path / "archive")
+    archive.put(make_message("m1"))
+    dir_emails = tmp_path / "emails"
+    dir_emails.mkdir()
+    (dir_emails / "emails-1.json").write_text(json.dumps([{"id": "m1"}, {"id": "m2"}]))
+    monkeypatch.setenv("DIR_EMAILS", str(dir_emails))
+
+    with patch('app.load_emails.get_db', return_value=db), \
+            patch('app.load_emails.get_archive', return_value=archive), \
+            patch('app.load_emails.fetch_email', side_effect=make_message) as mock_fetch:
+        load_emails.load_emails_to_db()
+
+    mock_fetch.assert_called_once_with("m2")
+    assert "m2" in MessageArchive(tmp_path / "archive")
+    assert sorted(email.email_id for email in db.query(Email)) == ["m1", "m2"]
+
+
+def test_reparse_archive_updates_rows_in_place(db, tmp_path):
+    """Test that reparse rewrites existing rows keeping their ids, inserts new ones and resets rule watermarks, without gmail calls."""
+    load_emails.load_email(load_emails.parse_email(make_message("m1")), db)
+    row_id = db.query(Email).filter_by(email_id="m1").one().id
+    db.add(RuleState(rule_key="rule", watermark=row_id, reference_date=0))
+    db.commit()
+    archive = MessageArchive(tmp_path)
+    changed = make_message("m1")
+    changed["payload"]["headers"][1]["value"] = "reparsed"
+    archive.put(changed)
+    archive.put(make_message("m2"))
+
+    with patch('app.load_emails.get_db', return_value=db), \
+            patch('app.load_emails.get_archive', return_value=archive), \
+            patch('app.load_emails.fetch_email') as mock_fetch:
+        load_emails.reparse_archive()
+        load_emails.reparse_archive()
+
+    mock_fetch.assert_not_called()
+    db.expire_all()
+    emails = {email.email_id: email for email in db.query(Email)}
+    assert sorted(emails) == ["m1", "m2"]
+    assert emails["m1"].id == row_id
+    assert emails["m1"].subject == "reparsed"
+    # Rules re-evaluate the rewritten rows on their next run.
+    assert db.query(RuleState).count() == 0
+
+
+def test_reparse_archive_without_from_header(db, tmp_path):
+    """Test that a message without From header is reparsed with an empty sender."""
+    archive = MessageArchive(tmp_path)
+    message = make_message("m1")
+    message["payload"]["headers"] = [{"name": "Subject", "value": "hi"}]
+    archive.put(message)
+
+    with patch('app.load_emails.get_db', return_value=db), \
+            patch('app.load_emails.get_archive', return_value=archive):
+        load_emails.reparse_archive()
+
+    email = db.query(Email).filter_by(email_id="m1").one()
+    assert (email.recv_from, email.from_address, email.from_domain) == ("", "", "")
+
+
+def test_reparse_archive_requires_archive():
+    """Test that reparse fails without DIR_ARCHIVE."""
+    with patch('app.load_emails.get_archive', return_value=None):
+        with pytest.raises(ValueError, match=r"DIR_ARCHIVE"):
+            load_emails.reparse_archive()
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,87 @@
+import pytest
+
+from sqlalchemy import inspect, text
+from app import migrate
+from migrations import v0004_sender
+from models import Email
+from util import parse_sender
+
+TABLE = Email.__tablename__
+
+
+def test_fresh_database_is_migrated_to_head(engine):
+    """Test that all migrations are applied on an empty database."""
+    assert migrate.current_version(engine) == 0
+
+    version = migrate.ensure_schema(engine)
+
+    assert version == migrate.HEAD
+    assert migrate.current_version(engine) == migrate.HEAD
+    assert inspect(engine).has_table(TABLE)
+
+
+def test_migrations_are_applied_once(engine):
+    """Test that a second start only checks the version."""
+    migrate.ensure_schema(engine)
+
+    def fail(conn):
+        raise AssertionError("migration ran twice")
+
+    with pytest.MonkeyPatch.context() as mp:
+        for migration in migrate.MIGRATIONS:
+            mp.setattr(migration, 'upgrade', fail)
+        assert migrate.ensure_schema(engine) == migrate.HEAD
+
+
+def test_upgrade_rereads_version_under_lock(engine, monkeypatch):
+    """Test that a process with a stale version check doesn't re-apply migrations another process applied."""
+    migrate.ensure_schema(engine)
+    monkeypatch.setattr(migrate, 'current_version', lambda engine: 0)
+
+    def fail(conn):
+        raise AssertionError("migration ran twice")
+
+    for migration in migrate.MIGRATIONS:
+        monkeypatch.setattr(migration, 'upgrade', fail)
+    assert migrate.ensure_schema(engine) == migrate.HEAD
+
+
+def test_sender_columns_are_backfilled(engine, monkeypatch):
+    """Test that existing emails get the same sender address and domain as the parser gives new mail."""
+    senders = [
+        "Shop <Sales@Shop.com>",
+        '"a <x@y.com>" <real@z.com>',
+        "a@b.com (Alice)",
+        "Name <mailto:j@x.com>",
+        "Undisclosed recipients",
+    ]
+    migrate.upgrade(engine, target=3)
+    with engine.begin() as conn:
+        for i, sender in enumerate(senders):
+            conn.execute(
+                text(f"INSERT INTO {TABLE} (email_id, message, date, subject, recv_from) VALUES (:id, '', 0, '', :sender)"),
+                {"id": f"m{i}", "sender": sender}
+            )
+
+    # Several keyset pages.
+    monkeypatch.setattr(v0004_sender, "BACKFILL_BATCH_SIZE", 2)
+    migrate.upgrade(engine)
+
+    with engine.connect() as conn:
+        rows = conn.execute(text(f"SELECT recv_from, from_address, from_domain FROM {TABLE} ORDER BY id")).all()
+    assert [(address, domain) for (_, address, domain) in rows] == [parse_sender(sender) for sender in senders]
+    assert rows[1][1:] == ("real@z.com", "z.com")
+    assert f"ix_{TABLE}_from_domain" in [index["name"] for index in inspect(engine).get_indexes(TABLE)]
+
+
+def test_newer_schema_is_rejected(engine, monkeypatch):
+    """Test that running old code against a newer schema fails loudly."""
+    migrate.ensure_schema(engine)
+    monkeypatch.setattr(migrate, 'HEAD', migrate.HEAD - 1)
+
+    with pytest.raises(RuntimeError, match=r"newer than this code"):
+        migrate.ensure_schema(engine)
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,159 @@
+import pytest
+
+from unittest.mock import patch, MagicMock
+from sqlalchemy import select
+from models import Email, RuleMatch, RuleState
+from rule import today_timestamp, DAY_MS
+from tests.helpers import make_rule
+
+TODAY = today_timestamp()
+
+
+def add_email(db, email_id, subject, date=TODAY, from_address="a@b.com"):
+    from_domain = from_address.rpartition("@")[2]
+    db.add(Email(email_id=email_id, message="", recv_from=from_address, subject=subject, date=date, from_address=from_address, from_domain=from_domain))
+    db.commit()
+
+
+def stored_matches(db, rule):
+    return sorted(db.execute(select(RuleMatch.email_row_id).where(RuleMatch.rule_key == rule.key)).scalars())
+
+
+def test_only_new_emails_are_evaluated(db):
+    """Test that each run only returns emails inserted after the watermark."""
+    rule = make_rule("all", ("subject", "contains", "order"))
+    add_email(db, "m1", "order 1")
+    add_email(db, "m2", "hello")
+
+    assert rule.evaluate_incremental(db) == [("m1", 1)]
+    db.commit()
+    assert rule.evaluate_incremental(db) == []
+    db.commit()
+
+    add_email(db, "m3", "order 2")
+    assert rule.evaluate_incremental(db) == [("m3", 3)]
+    db.commit()
+    assert stored_matches(db, rule) == [1, 3]
+
+
+def test_ids_committed_below_the_watermark_are_evaluated(db):
+    """Test that an email whose id was allocated before the last run but committed after it still matches."""
+    rule = make_rule("all", ("subject", "contains", "order"))
+    db.add(Email(id=5, email_id="m5", message="", recv_from="", subject="order 5", date=TODAY))
+    db.commit()
+    assert rule.evaluate_incremental(db) == [("m5", 5)]
+    db.commit()
+
+    db.add(Email(id=3, email_id="m3", message="", recv_from="", subject="order 3", date=TODAY))
+    db.commit()
+
+    assert rule.evaluate_incremental(db) == [("m3", 3)]
+    db.commit()
+    assert rule.evaluate_incremental(db) == []
+
+
+def test_missing_watermark_reconciles_matches(db):
+    """Test that without a watermark stale matches are dropped and only new matches are returned."""
+    rule = make_rule("all", ("subject", "contains", "order"))
+    add_email(db, "m1", "order 1")
+    add_email(db, "m2", "order 2")
+    rule.evaluate_incremental(db)
+    db.commit()
+
+    # e.g. after a reparse rewrote rows in place.
+    db.query(Email).filter_by(email_id="m1").update({"subject": "hello"})
+    db.query(Email).filter_by(email_id="m2").update({"subject": "hello"})
+    db.query(RuleState).delete()
+    db.commit()
+    add_email(db, "m3", "order 3")
+
+    assert rule.evaluate_incremental(db) == [("m3", 3)]
+    db.commit()
+    assert stored_matches(db, rule) == [3]
+
+
+def test_failed_actions_are_retried(db):
+    """Test that emails stay pending until every action succeeded on them."""
+    rule = make_rule("all", ("subject", "contains", "order"))
+    action = MagicMock(action="move", param="INBOX")
+    rule.actions = [action]
+    add_email(db, "m1", "order 1")
+    add_email(db, "m2", "order 2")
+
+    with patch('rule.SessionLocal', return_value=db):
+        action.return_value = ["m1"]
+        rule.apply()
+        action.assert_called_once_with(["m1", "m2"])
+
+        action.reset_mock()
+        action.return_value = ["m2"]
+        rule.apply()
+        action.assert_called_once_with(["m2"])
+
+        action.reset_mock()
+        rule.apply()
+        action.assert_not_called()
+
+
+def test_rule_key_depends_on_conditions_and_actions():
+    """Test that identical rules share state and changed rules don't."""
+    rule = make_rule("all", ("subject", "contains", "order"), ("date", "ltndays", 2))
+
+    assert rule.key == make_rule("all", ("subject", "contains", "order"), ("date", "ltndays", 2)).key
+    assert rule.key != make_rule("any", ("subject", "contains", "order"), ("date", "ltndays", 2)).key
+    assert rule.key != make_rule("all", ("subject", "contains", "order"), ("date", "ltndays", 3)).key
+
+
+def test_date_rules_recheck_rows_crossing_the_boundary(db):
+    """Test that emails leave and join date relative rules as days pass, without new inserts."""
+    recent = make_rule("all", ("date", "ltndays", 2))
+    old = make_rule("all", ("date", "gtndays", 2))
+    add_email(db, "m1", "a", date=TODAY - 1 * DAY_MS)
+    add_email(db, "m2", "b", date=TODAY - 5 * DAY_MS)
+
+    assert recent.evaluate_incremental(db) == [("m1", 1)]
+    assert old.evaluate_incremental(db) == [("m2", 2)]
+    db.commit()
+
+    # Two days later m1 is older than 2 days.
+    with patch('rule.today_timestamp', return_value=TODAY + 2 * DAY_MS):
+        recent = make_rule("all", ("date", "ltndays", 2))
+        old = make_rule("all", ("date", "gtndays", 2))
+        assert recent.evaluate_incremental(db) == []
+        assert old.evaluate_incremental(db) == [("m1", 1)]
+        db.commit()
+
+    assert stored_matches(db, recent) == []
+    assert stored_matches(db, old) == [1, 2]
+
+
+def test_sender_rules_match_normalized_lists(db):
+    """Test that sender rules compare lower cased values against allow and deny lists."""
+    add_email(db, "m1", "a", from_address="orders@amazon.com")
+    add_email(db, "m2", "b", from_address="alerts@bank.com")
+    add_email(db, "m3", "c", from_address="f@mail.com")
+
+    assert make_rule("all", ("from_domain", "equals", "@Amazon.COM")).evaluate_incremental(db) == [("m1", 1)]
+    assert make_rule("all", ("from_domain", "in", ["bank.com", "MAIL.com", "bank.com"])).evaluate_incremental(db) == [("m2", 2), ("m3", 3)]
+    assert make_rule("all", ("from_address", "notin", ["f@mail.com"])).evaluate_incremental(db) == [("m1", 1), ("m2", 2)]
+
+    with pytest.raises(ValueError, match=r"Value must be a list of strings."):
+        make_rule("all", ("from_domain", "in", "amazon.com"))
+    with pytest.raises(ValueError, match=r"Predicate .* must be one of"):
+        make_rule("all", ("from_domain", "contains", "amazon"))
+
+
+def test_reset_reevaluates_everything(db):
+    """Test that a full run returns all matches again."""
+    rule = make_rule("all", ("subject", "contains", "order"))
+    add_email(db, "m1", "order 1")
+    rule.evaluate_incremental(db)
+    db.commit()
+
+    rule.reset(db)
+
+    assert rule.evaluate_incremental(db) == [("m1", 1)]
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,105 @@
+import datetime
+import numpy as np
+import pytest
+
+from sqlalchemy import select
+from app import snapshot as snapshot_module
+from app.snapshot import Snapshot, overlap_matrix
+from models import Email
+from tests.helpers import make_rule
+
+NOW = datetime.datetime.now().timestamp() * 1000
+DAY = 60 * 60 * 24 * 1000
+
+ROWS = [
+    (1, NOW, "m1", "Amazon <orders@amazon.com>", "Your Order shipped", "hello", "orders@amazon.com", "amazon.com"),
+    (2, NOW - 10 * DAY, "m2", "Amazon <orders@amazon.com>", "Old order", "hello", "orders@amazon.com", "amazon.com"),
+    (3, NOW, "m3", "Bank <alerts@bank.com>", "Statement", "your order", "alerts@bank.com", "bank.com"),
+    (4, NOW, "m4", "Friend <f@mail.com>", "Dinner", "héllo ünicode", "f@mail.com", "mail.com"),
+]
+
+
+def matched_ids(snapshot, rule):
+    return snapshot.columns["id"][snapshot.evaluate(rule)].tolist()
+
+
+@pytest.fixture
+def snapshot():
+    return Snapshot.from_rows(ROWS)
+
+
+def test_string_predicates(snapshot):
+    """Test that contains is case insensitive and equals is exact, as in SQL."""
+    assert matched_ids(snapshot, make_rule("all", ("subject", "contains", "ORDER"))) == [1, 2]
+    assert matched_ids(snapshot, make_rule("all", ("subject", "notcontains", "order"))) == [3, 4]
+    assert matched_ids(snapshot, make_rule("all", ("subject", "equals", "Dinner"))) == [4]
+    assert matched_ids(snapshot, make_rule("all", ("subject", "equals", "dinner"))) == []
+    assert matched_ids(snapshot, make_rule("all", ("subject", "notequals", "Dinner"))) == [1, 2, 3]
+
+
+def test_composite_predicates(snapshot):
+    """Test that all/any combine rules and date rules are relative to today."""
+    rule = make_rule("all", ("recv_from", "contains", "amazon"), ("date", "ltndays", 2))
+    assert matched_ids(snapshot, rule) == [1]
+
+    rule = make_rule("any", ("message", "contains", "order"), ("recv_from", "contains", "friend"))
+    assert matched_ids(snapshot, rule) == [3, 4]
+
+    rule = make_rule("all", ("date", "gtndays", 2))
+    assert matched_ids(snapshot, rule) == [2]
+
+
+def test_sender_predicates(snapshot):
+    """Test that sender rules match normalized addresses and domains against lists."""
+    assert matched_ids(snapshot, make_rule("all", ("from_domain", "equals", "@Amazon.com"))) == [1, 2]
+    assert matched_ids(snapshot, make_rule("all", ("from_domain", "in", ["bank.com", "mail.com"]))) == [3, 4]
+    assert matched_ids(snapshot, make_rule("all", ("from_address", "notin", ["F@mail.com", "alerts@bank.com"]))) == [1, 2]
+
+
+def test_save_and_load(snapshot, tmp_path):
+    """Test that snapshot survives a round trip including non ascii text."""
+    path = tmp_path / "emails.npz"
+    snapshot.save(path)
+    loaded = Snapshot.load(path)
+
+    assert loaded.columns["id"].tolist() == [1, 2, 3, 4]
+    assert loaded.columns["message"].tolist() == [row[5] for row in ROWS]
+    assert matched_ids(loaded, make_rule("all", ("message", "contains", "ÜNICODE"))) == [4]
+
+
+def test_snapshot_matches_sql(db):
+    """Test that the snapshot gives the same matches as the SQL predicates, LIKE wildcards included."""
+    senders = ["no-reply@x.com", "no_reply@y.com", "noXreply@z.com", "sales@shop.com", "Offers 100% <a@b.com>"]
+    for i, sender in enumerate(senders):
+        db.add(Email(email_id=f"m{i}", message="", recv_from=sender, subject="", date=NOW))
+    db.commit()
+    snapshot = Snapshot.export(db)
+
+    for value in ["no_reply", "NO-REPLY", "no%reply", "100%", "_@", "sales", "%"]:
+        for predicate in ["contains", "notcontains"]:
+            rule = make_rule("all", ("recv_from", predicate, value))
+            expected = db.execute(select(Email.id).where(rule.condition()).order_by(Email.id)).scalars().all()
+            assert matched_ids(snapshot, rule) == expected, (predicate, value)
+
+
+def test_from_rows_in_batches():
+    """Test that building from rows in small batches gives the same columns."""
+    batched = Snapshot.from_rows(iter(ROWS), batch_size=3)
+
+    assert batched.columns["id"].tolist() == [1, 2, 3, 4]
+    assert batched.columns["subject"].tolist() == [row[4] for row in ROWS]
+    assert len(Snapshot.from_rows([])) == 0
+
+
+def test_overlap_matrix(monkeypatch):
+    """Test that overlap matrix counts pairwise intersections across chunks."""
+    masks = [np.array([True, True, False]), np.array([False, True, True])]
+    assert overlap_matrix(masks).tolist() == [[2, 1], [1, 2]]
+
+    monkeypatch.setattr(snapshot_module, "OVERLAP_CHUNK_SIZE", 2)
+    assert overlap_matrix(masks).tolist() == [[2, 1], [1, 2]]
+    assert overlap_matrix([]).shape == (0, 0)
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -98,5 +98,16 @@ def test_load_creds_expired_token(mock_open, mock_exists, mock_creds):
     assert creds == fake_creds
 
 
+@pytest.mark.parametrize("recv_from, expected", [
+    ('"Amazon" <Orders@Amazon.com>', ("orders@amazon.com", "amazon.com")),
+    ("alerts@bank.com", ("alerts@bank.com", "bank.com")),
+    ("Undisclosed recipients", ("", "")),
+    ("", ("", "")),
+])
+def test_parse_sender(recv_from, expected):
+    """Test that sender address and domain are extracted and normalized."""
+    assert util.parse_sender(recv_from) == expected
+
+
 if __name__ == "__main__":
     pytest.main()